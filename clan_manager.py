@@ -0,0 +1,426 @@
+"""Clan data storage and rules, kept free of discord imports.
+
+This module can be compiled ahead of time with mypyc (``mypyc clan_manager.py``);
+the resulting extension module is picked up by ``import clan_manager`` in
+place of this file.
+"""
+import asyncio
+import mmap
+import orjson
+import os
+import re
+import sys
+import threading
+from dataclasses import dataclass
+from enum import IntEnum
+from functools import lru_cache
+from typing import Any, Optional
+
+
+CLAN_DATA_FILE = 'clan_data.json'
+SAVE_INTERVAL = 5  # seconds between background saves of changed clan data
+SAVE_BUFFER_SIZE = 1 << 18  # 256 KiB write buffer for clan data saves
+_NON_BLANK = re.compile(rb'\S')
+
+class Role(IntEnum):
+    """Clan roles, ordered so higher roles compare greater"""
+    MEMBER = 0
+    MOD = 1
+    COLEADER = 2
+    LEADER = 3
+
+ROLE_NAMES = {
+    Role.MEMBER: "Member",
+    Role.MOD: "Mod",
+    Role.COLEADER: "Co-Leader",
+    Role.LEADER: "Leader",
+}
+
+# Lowest role allowed to perform each permission-checked action
+ACTION_MIN_ROLES: dict[str, Role] = {
+    "kick": Role.MOD,
+    "invite": Role.COLEADER,
+    "promote_demote": Role.COLEADER,
+}
+
+@dataclass(slots=True)
+class Clan:
+    """A clan's leader and the role of every member, leader included"""
+    leader: int
+    roles: dict[int, Role]
+
+def _load_roles(clan: dict[str, Any]) -> dict[int, Role]:
+    """Build a clan's player ID -> Role map from its stored JSON object"""
+    if "roles" in clan:
+        return {int(k): Role(v) for k, v in clan["roles"].items()}
+    # Older files kept parallel members/mods/coleaders lists instead
+    roles = {player_id: Role.MEMBER for player_id in clan.pop("members")}
+    for player_id in clan.pop("mods"):
+        roles[player_id] = Role.MOD
+    for player_id in clan.pop("coleaders"):
+        roles[player_id] = Role.COLEADER
+    roles[clan["leader"]] = Role.LEADER
+    return roles
+
+@lru_cache(maxsize=1024)
+def _cached_permission(manager: "ClanManager", player_id: int, clan_name: str, action: str, version: int) -> bool:
+    """Memoized permission check; a new data version makes old entries unreachable"""
+    return manager._check_permission(player_id, clan_name, action)
+
+class BufferedSaves:
+    """Async context manager returned by ClanManager.buffered"""
+    # A plain class rather than @asynccontextmanager, which mypyc cannot compile
+    def __init__(self, manager: "ClanManager") -> None:
+        self._manager = manager
+    
+    async def __aenter__(self) -> None:
+        self._manager._buffer_depth += 1
+    
+    async def __aexit__(self, *exc_info: object) -> None:
+        manager = self._manager
+        manager._buffer_depth -= 1
+        if not manager._buffer_depth:
+            # Go through flush so the write stays off the event loop and is
+            # ordered after any flush already in progress
+            await manager.flush()
+
+class ClanManager:
+    def __init__(self) -> None:
+        self.clan_data: dict[str, Any] = self.load_data()
+        self.name_index: dict[str, int] = self.clan_data.setdefault("names", {})
+        # Player ID -> clan name; this is the stored "players" dict itself
+        self.player_clan: dict[int, str] = self.clan_data["players"]
+        self._dirty = False
+        self._version = 0
+        self._buffer_depth = 0
+        self._save_lock = asyncio.Lock()
+        # A cancelled flush can leave its write running in the worker thread
+        self._write_lock = threading.Lock()
+    
+    def load_data(self) -> dict[str, Any]:
+        """Load clan data from JSON file"""
+        if os.path.exists(CLAN_DATA_FILE):
+            data: Optional[dict[str, Any]] = None
+            with open(CLAN_DATA_FILE, 'rb') as f:
+                # An empty file is treated the same as a missing one (and
+                # cannot be mapped anyway)
+                if os.fstat(f.fileno()).st_size:
+                    # Parse straight from the mapped pages instead of reading
+                    # the whole file into a bytes object first
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        if _NON_BLANK.search(mm):
+                            with memoryview(mm) as view:
+                                data = orjson.loads(view)
+            if data is not None:
+                # JSON object keys are always strings; player IDs are ints.
+                # Players map straight to their clan name; older files stored
+                # a {"clan", "role"} object instead (roles now live in each
+                # clan's "roles"). Clan names are interned so all of a clan's
+                # players share one string.
+                data["players"] = {
+                    int(k): sys.intern(v if isinstance(v, str) else v["clan"])
+                    for k, v in data["players"].items()
+                }
+                data["clans"] = {
+                    sys.intern(k): Clan(v["leader"], _load_roles(v))
+                    for k, v in data["clans"].items()
+                }
+                return data
+        return {"clans": {}, "players": {}, "names": {}}
+    
+    async def flush(self) -> None:
+        """Save clan data in a worker thread if it changed since the last save"""
+        async with self._save_lock:
+            if self._dirty and not self._buffer_depth:
+                # Serialize on the event loop so no command mutates the data
+                # mid-dump; only the blocking file write runs in the thread
+                payload = self._dump_data()
+                try:
+                    await asyncio.to_thread(self._write_data, payload)
+                except BaseException:
+                    # Keep the changes pending so the next flush retries them
+                    self._dirty = True
+                    raise
+    
+    def buffered(self) -> "BufferedSaves":
+        """Hold back saves during a batch of changes and flush once at the end"""
+        return BufferedSaves(self)
+    
+    def _dump_data(self) -> bytes:
+        """Serialize clan data and clear the dirty flag"""
+        self._dirty = False
+        return orjson.dumps(self.clan_data, option=orjson.OPT_NON_STR_KEYS)
+    
+    def _write_data(self, payload: bytes) -> None:
+        """Replace the clan data file with the serialized payload"""
+        tmp_file = CLAN_DATA_FILE + '.tmp'
+        with self._write_lock:
+            with open(tmp_file, 'wb', buffering=SAVE_BUFFER_SIZE) as f:
+                f.write(payload)
+                f.flush()
+                # Make sure the data is on disk before it replaces the old file
+                os.fsync(f.fileno())
+            os.replace(tmp_file, CLAN_DATA_FILE)
+    
+    def _mark_dirty(self) -> None:
+        """Flag clan data as changed so the next flush writes it"""
+        self._dirty = True
+        self._version += 1
+    
+    def create_clan(self, leader_id: int, clan_name: str) -> tuple[bool, str]:
+        """Create a new clan"""
+        clans = self.clan_data["clans"]
+        if clan_name in clans:
+            return False, "Clan name already exists"
+        
+        clan_name = sys.intern(clan_name)
+        clans[clan_name] = Clan(leader_id, {leader_id: Role.LEADER})
+        
+        self.player_clan[leader_id] = clan_name
+        
+        self._mark_dirty()
+        return True, f"Clan '{clan_name}' created successfully!"
+    
+    def get_player_clan(self, player_id: int) -> Optional[str]:
+        """Get the clan a player belongs to"""
+        return self.player_clan.get(player_id)
+    
+    def get_player_role(self, player_id: int) -> Role:
+        """Get the role of a player in their clan"""
+        clan_name = self.player_clan.get(player_id)
+        if clan_name is None:
+            return Role.MEMBER
+        clan: Clan = self.clan_data["clans"][clan_name]
+        return clan.roles[player_id]
+    
+    def is_leader(self, player_id: int, clan_name: str) -> bool:
+        """Check if player is leader of the clan"""
+        clan: Clan = self.clan_data["clans"][clan_name]
+        return clan.leader == player_id
+    
+    def is_coleader(self, player_id: int, clan_name: str) -> bool:
+        """Check if player is co-leader of the clan"""
+        clan: Clan = self.clan_data["clans"][clan_name]
+        return clan.roles.get(player_id) == Role.COLEADER
+    
+    def is_mod(self, player_id: int, clan_name: str) -> bool:
+        """Check if player is mod of the clan"""
+        clan: Clan = self.clan_data["clans"][clan_name]
+        return clan.roles.get(player_id) == Role.MOD
+    
+    def has_permission(self, player_id: int, clan_name: str, action: str) -> bool:
+        """Check if player has permission for an action"""
+        return _cached_permission(self, player_id, clan_name, action, self._version)
+    
+    def _check_permission(self, player_id: int, clan_name: str, action: str) -> bool:
+        """Uncached permission check used by has_permission"""
+        clan: Clan = self.clan_data["clans"][clan_name]
+        if clan.leader == player_id:
+            return True
+        
+        min_role = ACTION_MIN_ROLES.get(action)
+        if min_role is None:
+            return False
+        
+        # Members of this clan are read from the bound clan; anyone else
+        # falls back to their role in their own clan, as before
+        role = clan.roles.get(player_id)
+        if role is None:
+            role = self.get_player_role(player_id)
+        return role >= min_role
+    
+    def kick_member(self, kicker_id: int, target_name: str, clan_name: str) -> tuple[bool, str]:
+        """Kick a member from the clan"""
+
+        target_id = self.find_player_id_by_name(target_name)
+        if not target_id:
+            return False, "Player not found"
+        
+        if target_id == kicker_id:
+            return False, "You cannot kick yourself"
+        
+        clan: Clan = self.clan_data["clans"][clan_name]
+        
+        # Check if target is in clan
+        if target_id not in clan.roles:
+            return False, "Player is not in your clan"
+        
+        # Check permissions
+        if not self.has_permission(kicker_id, clan_name, "kick"):
+            return False, "You don't have permission to kick members"
+        
+        # Cannot kick leaders
+        if clan.leader == target_id:
+            return False, "You cannot kick the clan leader"
+        
+        self._detach_player(target_id)
+        self._mark_dirty()
+        return True, f"Successfully kicked {target_name} from the clan"
+    
+    def invite_member(self, inviter_id: int, target_name: str, clan_name: str) -> tuple[bool, str]:
+        """Invite a player to the clan"""
+
+        target_id = self.find_player_id_by_name(target_name)
+        if not target_id:
+            return False, "Player not found"
+        
+        if not self.has_permission(inviter_id, clan_name, "invite"):
+            return False, "You don't have permission to invite members"
+        
+
+        if target_id in self.player_clan:
+            return False, "Player is already in a clan"
+        
+        # Add to clan, storing the same interned name as the clans key
+        clan_name = sys.intern(clan_name)
+        clan = self.clan_data["clans"][clan_name]
+        clan.roles[target_id] = Role.MEMBER
+        
+        self.player_clan[target_id] = clan_name
+        
+        self._mark_dirty()
+        return True, f"Successfully invited {target_name} to the clan"
+    
+    def disband_clan(self, leader_id: int, clan_name: str) -> tuple[bool, str]:
+        """Disband a clan"""
+        if not self.is_leader(leader_id, clan_name):
+            return False, "Only the clan leader can disband the clan"
+        
+        self._remove_clan(clan_name)
+        self._mark_dirty()
+        
+        return True, f"Clan '{clan_name}' has been disbanded"
+    
+    def promote_member(self, promoter_id: int, target_name: str, clan_name: str, role: Role) -> tuple[bool, str]:
+        """Promote a clan member"""
+        target_id = self.find_player_id_by_name(target_name)
+        if not target_id:
+            return False, "Player not found"
+        
+        if not self.has_permission(promoter_id, clan_name, "promote_demote"):
+            return False, "You don't have permission to promote members"
+        
+        roles: dict[int, Role] = self.clan_data["clans"][clan_name].roles
+        if target_id not in roles:
+            return False, "Player is not in your clan"
+        
+        current_role = roles[target_id]
+        
+        if role == Role.MOD:
+            if current_role != Role.MEMBER:
+                return False, f"Player is already {ROLE_NAMES[current_role]}"
+            roles[target_id] = Role.MOD
+        
+        elif role == Role.COLEADER:
+            if current_role >= Role.COLEADER:
+                return False, f"Player is already {ROLE_NAMES[current_role]}"
+            roles[target_id] = Role.COLEADER
+        
+        else:
+            # Only Mod and Co-Leader can be promoted to
+            return False, f"Players cannot be promoted to {ROLE_NAMES[role]}"
+        
+        self._mark_dirty()
+        return True, f"Successfully promoted {target_name} to {ROLE_NAMES[role]}"
+    
+    def demote_member(self, demoter_id: int, target_name: str, clan_name: str) -> tuple[bool, str]:
+        """Demote a clan member"""
+        target_id = self.find_player_id_by_name(target_name)
+        if not target_id:
+            return False, "Player not found"
+        
+        if not self.has_permission(demoter_id, clan_name, "promote_demote"):
+            return False, "You don't have permission to demote members"
+        
+        roles: dict[int, Role] = self.clan_data["clans"][clan_name].roles
+        if target_id not in roles:
+            return False, "Player is not in your clan"
+        
+        current_role = roles[target_id]
+        
+        if current_role == Role.COLEADER:
+            roles[target_id] = Role.MOD
+        elif current_role == Role.MOD:
+            roles[target_id] = Role.MEMBER
+        else:
+            return False, "Cannot demote a regular member"
+        
+        self._mark_dirty()
+        return True, f"Successfully demoted {target_name}"
+    
+    def force_kick(self, target_name: str) -> tuple[bool, str]:
+        """Staff command: Force kick a player from any clan"""
+        target_id = self.find_player_id_by_name(target_name)
+        if not target_id:
+            return False, "Player not found"
+        
+        clan_name = self._detach_player(target_id)
+        if clan_name is None:
+            return False, "Player is not in any clan"
+        
+        self._mark_dirty()
+        
+        return True, f"Force kicked {target_name} from {clan_name}"
+    
+    def force_join(self, target_name: str, clan_name: str) -> tuple[bool, str]:
+        """Staff command: Force join a player to a clan"""
+        target_id = self.find_player_id_by_name(target_name)
+        if not target_id:
+            return False, "Player not found"
+        
+        clan: Optional[Clan] = self.clan_data["clans"].get(clan_name)
+        if clan is None:
+            return False, "Clan not found"
+        
+        # Staff pass a typed-in name; store the same interned string as the key
+        clan_name = sys.intern(clan_name)
+        self._detach_player(target_id)
+        
+        # Add to new clan
+        clan.roles[target_id] = Role.MEMBER
+        
+        self.player_clan[target_id] = clan_name
+        
+        self._mark_dirty()
+        return True, f"Force joined {target_name} to {clan_name}"
+    
+    def delete_clan(self, clan_name: str) -> tuple[bool, str]:
+        """Staff command: Delete a clan"""
+        if clan_name not in self.clan_data["clans"]:
+            return False, "Clan not found"
+        
+        self._remove_clan(clan_name)
+        self._mark_dirty()
+        
+        return True, f"Clan '{clan_name}' has been deleted"
+    
+    def _detach_player(self, player_id: int) -> Optional[str]:
+        """Remove a player from their clan, returning its name (None if clanless)"""
+        # The player_clan entry says which clan to touch, so there is one
+        # delete per structure and no membership checks
+        clan_name = self.player_clan.pop(player_id, None)
+        if clan_name is not None:
+            del self.clan_data["clans"][clan_name].roles[player_id]
+        return clan_name
+    
+    def _remove_clan(self, clan_name: str) -> None:
+        """Remove a clan and all of its players"""
+        clan_data = self.clan_data
+        # Rebuild the players dict in one pass instead of deleting members one
+        # by one; each entry already names its clan, so the clan's roles are
+        # not needed (and clan names are interned, so != is mostly identity)
+        self.player_clan = clan_data["players"] = {
+            player_id: name for player_id, name in self.player_clan.items()
+            if name != clan_name
+        }
+        del clan_data["clans"][clan_name]
+    
+    def register_player(self, player_id: int, name: str) -> None:
+        """Remember a player's name so commands can look them up by it"""
+        if self.name_index.get(name) != player_id:
+            self.name_index[name] = player_id
+            self._mark_dirty()
+    
+    def find_player_id_by_name(self, name: str) -> Optional[int]:
+        """Find a player ID by name"""
+        return self.name_index.get(name)